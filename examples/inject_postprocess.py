@@ -2,20 +2,128 @@ import onnx
 from onnx import helper, TensorProto, numpy_helper
 import argparse
 
-def make_slice_col(g, src, start, end, out_name):
-    """Slice last-dim [start:end] while preserving [1, N, 1]"""
-    starts = helper.make_tensor(out_name+"_starts", TensorProto.INT64, [3], [0, start, 0])
-    ends   = helper.make_tensor(out_name+"_ends",   TensorProto.INT64, [3], [1, end, 9223372036854775807])
-    axes   = helper.make_tensor(out_name+"_axes",   TensorProto.INT64, [3], [0, 1, 2])
-    steps  = helper.make_tensor(out_name+"_steps",  TensorProto.INT64, [3], [1, 1, 1])
-    g.initializer.extend([starts, ends, axes, steps])
-    return helper.make_node("Slice", [src, starts.name, ends.name, axes.name, steps.name], [out_name])
+def make_split_cols(g, src, sizes, out_names, opset):
+    """Split last-dim into column groups in one pass, e.g. [1, N, 7] -> [1, N, 4] + 3 x [1, N, 1]"""
+    if opset < 13:
+        return helper.make_node("Split", [src], out_names, axis=2, split=sizes)
+    split = helper.make_tensor(src+"_split", TensorProto.INT64, [len(sizes)], sizes)
+    g.initializer.append(split)
+    return helper.make_node("Split", [src, split.name], out_names, axis=2)
+
+def make_const(g, name, dtype, dims, vals):
+    """Register an initializer and return its name"""
+    g.initializer.append(helper.make_tensor(name, dtype, dims, vals))
+    return name
+
+def make_class_scores(g, args):
+    """每个框只在自身类别上保留分数：nms_cls_scores [1,N,C]"""
+    if args.num_classes <= 0:
+        raise SystemExit("per-class scores require --num-classes")
+    # ORT 的 OneHot 只注册了 (indices, depth) 同类型的 float 组合：cls_id 为 float，depth 也用 float
+    depth = make_const(g, "nms_num_classes", TensorProto.FLOAT, [1], [float(args.num_classes)])
+    onehot_vals = make_const(g, "nms_onehot_values", TensorProto.FLOAT, [2], [0.0, 1.0])
+    cls_shape = make_const(g, "nms_cls_shape", TensorProto.INT64, [3], [0, -1, args.num_classes])
+    return [
+        helper.make_node("OneHot", ["cls_id", depth, onehot_vals], ["nms_onehot"], axis=-1),
+        helper.make_node("Reshape", ["nms_onehot", cls_shape], ["nms_cls_mask"]),
+        helper.make_node("Mul", ["nms_cls_mask", "score"], ["nms_cls_scores"]),
+    ]
+
+def make_onnx_nms(g, args):
+    """Standard NonMaxSuppression on post_dets -> nms_dets [1, M, 6]
+
+    Per-class when --num-classes is given (same keeps as batched_nms in self_valid.py),
+    otherwise / with --class-agnostic a single score row.
+    max_output_boxes_per_class is per class: up to C x max_det rows, grouped by class.
+    """
+    max_det = make_const(g, "nms_max_output_boxes", TensorProto.INT64, [1], [args.max_det])
+    iou_thr = make_const(g, "nms_iou_threshold", TensorProto.FLOAT, [1], [args.iou_thres])
+    score_thr = make_const(g, "nms_score_threshold", TensorProto.FLOAT, [1], [args.conf_thres])
+    box_col = make_const(g, "nms_box_col", TensorProto.INT64, [], [2])
+
+    if args.class_agnostic or args.num_classes <= 0:
+        # scores [1,1,N]
+        nodes = [helper.make_node("Transpose", ["score"], ["nms_scores"], perm=[0, 2, 1])]
+    else:
+        # scores [1,C,N]
+        nodes = make_class_scores(g, args)
+        nodes.append(helper.make_node("Transpose", ["nms_cls_scores"], ["nms_scores"], perm=[0, 2, 1]))
+    nodes += [
+        # boxes 直接复用 c_boxes [1,N,4]；x/y 交换不影响 IoU，center_point_box=0 可直接使用 xyxy
+        # selected_indices [M,3] = (batch, class, box)
+        helper.make_node("NonMaxSuppression",
+                         ["c_boxes", "nms_scores", max_det, iou_thr, score_thr],
+                         ["nms_selected"]),
+        helper.make_node("Gather", ["nms_selected", box_col], ["nms_box_idx"], axis=1),
+        helper.make_node("Gather", ["post_dets", "nms_box_idx"], ["nms_dets"], axis=1),
+    ]
+    outputs = [helper.make_tensor_value_info("nms_dets", TensorProto.FLOAT, [1, "nms_unk", 6])]
+    return nodes, outputs
+
+def make_trt_nms(g, args):
+    """EfficientNMS_TRT plugin on post_dets (TensorRT only, not runnable in ORT)"""
+    # 插件只输出类别下标，因此即使 --class-agnostic 也要用 [1,N,C] 分数来带出 det_classes
+    nodes = make_class_scores(g, args)
+    nodes.append(
+        helper.make_node("EfficientNMS_TRT",
+                         ["c_boxes", "nms_cls_scores"],
+                         ["num_dets", "det_boxes", "det_scores", "det_classes"],
+                         domain="TRT",
+                         plugin_version="1",
+                         background_class=-1,
+                         max_output_boxes=args.max_det,
+                         score_threshold=args.conf_thres,
+                         iou_threshold=args.iou_thres,
+                         score_activation=0,
+                         box_coding=0,
+                         class_agnostic=int(args.class_agnostic)))
+    outputs = [
+        helper.make_tensor_value_info("num_dets", TensorProto.INT32, [1, 1]),
+        helper.make_tensor_value_info("det_boxes", TensorProto.FLOAT, [1, args.max_det, 4]),
+        helper.make_tensor_value_info("det_scores", TensorProto.FLOAT, [1, args.max_det]),
+        helper.make_tensor_value_info("det_classes", TensorProto.INT32, [1, args.max_det]),
+    ]
+    return nodes, outputs
+
+def smoke_test(path):
+    """用 onnxruntime 加载并以全零输入跑一次补丁后的模型，尽早发现缺失的算子实现"""
+    try:
+        import numpy as np
+        import onnxruntime as ort
+    except ImportError:
+        print("⚠️ onnxruntime not installed, skip smoke test")
+        return
+    sess = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    feeds = {
+        i.name: np.zeros([d if isinstance(d, int) and d > 0 else 1 for d in i.shape], dtype=np.float32)
+        for i in sess.get_inputs()
+    }
+    outs = sess.run(None, feeds)
+    shapes = {o.name: v.shape for o, v in zip(sess.get_outputs(), outs)}
+    print("✅ onnxruntime smoke test passed:", shapes)
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="inp", required=True)
     ap.add_argument("--out", dest="out", required=True)
+    ap.add_argument("--nms", choices=["none", "onnx", "trt"], default="onnx",
+                    help="append in-graph NMS: ONNX NonMaxSuppression or TensorRT EfficientNMS_TRT")
+    ap.add_argument("--conf-thres", dest="conf_thres", type=float, default=0.25)
+    ap.add_argument("--iou-thres", dest="iou_thres", type=float, default=0.45)
+    ap.add_argument("--max-det", dest="max_det", type=int, default=200,
+                    help="onnx: max boxes kept per class (up to C x max_det rows); trt: max boxes in total")
+    ap.add_argument("--num-classes", dest="num_classes", type=int, default=0,
+                    help="number of classes; enables per-class NMS for --nms onnx "
+                         "(class-agnostic without it), required by --nms trt")
+    ap.add_argument("--class-agnostic", dest="class_agnostic", action="store_true",
+                    help="suppress overlapping boxes across classes instead of per class")
+    ap.add_argument("--no-simplify", dest="simplify", action="store_false",
+                    help="skip onnxsim constant folding before save")
+    ap.add_argument("--no-check", dest="check", action="store_false",
+                    help="skip the onnxruntime smoke test of the patched model")
     args = ap.parse_args()
+    if args.nms == "onnx" and args.num_classes <= 0 and not args.class_agnostic:
+        print("ℹ️ --num-classes not given, using class-agnostic NMS")
 
     model = onnx.load(args.inp)
     g = model.graph
@@ -45,26 +153,25 @@ def main():
     # transpose -> [1, N, 7]
     t1 = helper.make_node("Transpose", [raw_new], ["n7"], perm=[0, 2, 1])
 
-    # slice 7 列
-    s_x1 = make_slice_col(g, "n7", 0, 1, "c_x1")
-    s_y1 = make_slice_col(g, "n7", 1, 2, "c_y1")
-    s_x2 = make_slice_col(g, "n7", 2, 3, "c_x2")
-    s_y2 = make_slice_col(g, "n7", 3, 4, "c_y2")
-    s_f4 = make_slice_col(g, "n7", 4, 5, "c_f4")
-    s_f5 = make_slice_col(g, "n7", 5, 6, "c_f5")
-    s_f6 = make_slice_col(g, "n7", 6, 7, "c_f6")
+    # 一次 Split 拆出 boxes(4 列) + f4/f5/f6
+    opset = next((o.version for o in model.opset_import if o.domain in ("", "ai.onnx")), 13)
+    split = make_split_cols(g, "n7", [4, 1, 1, 1], ["c_boxes", "c_f4", "c_f5", "c_f6"], opset)
 
     # scoreA = f4 * f6
     mul = helper.make_node("Mul", ["c_f4", "c_f6"], ["scoreA"])
     # score = Max(scoreA, f4)
     mx = helper.make_node("Max", ["scoreA", "c_f4"], ["score"])
 
-    # cls_id = Round(f5)
-    rnd = helper.make_node("Round", ["c_f5"], ["cls_id"])
+    # cls_id = float(int(f5 + 0.5))：类别号非负时与 Round(f5) 等价，
+    # Add + Cast 比 Round 便宜（截断转换即可），且 Concat 仍需 float
+    half = make_const(g, "cls_half", TensorProto.FLOAT, [], [0.5])
+    cls_bias = helper.make_node("Add", ["c_f5", half], ["cls_biased"])
+    cls_int = helper.make_node("Cast", ["cls_biased"], ["cls_id_i32"], to=TensorProto.INT32)
+    cls_flt = helper.make_node("Cast", ["cls_id_i32"], ["cls_id"], to=TensorProto.FLOAT)
 
     # concat -> [1,N,6]
     cat = helper.make_node("Concat",
-                           ["c_x1","c_y1","c_x2","c_y2","score","cls_id"],
+                           ["c_boxes","score","cls_id"],
                            ["post_dets"],
                            axis=2)
 
@@ -76,12 +183,40 @@ def main():
     )
     g.output.append(new_out)
 
-    g.node.extend([t1, s_x1, s_y1, s_x2, s_y2, s_f4, s_f5, s_f6, mul, mx, rnd, cat])
+    g.node.extend([t1, split, mul, mx, cls_bias, cls_int, cls_flt, cat])
+
+    # 图内 NMS：post_dets 仍为第一个输出，NMS 结果追加在其后
+    if args.nms == "onnx":
+        nms_nodes, nms_outputs = make_onnx_nms(g, args)
+    elif args.nms == "trt":
+        nms_nodes, nms_outputs = make_trt_nms(g, args)
+        model.opset_import.append(helper.make_opsetid("TRT", 1))
+    else:
+        nms_nodes, nms_outputs = [], []
+    g.node.extend(nms_nodes)
+    g.output.extend(nms_outputs)
+
+    # 导出时一次性完成形状推断 + 常量折叠，避免每次建会话重复做
+    model = onnx.shape_inference.infer_shapes(model)
+    if args.simplify and args.nms != "trt":  # EfficientNMS_TRT 无法在 onnxsim 中执行
+        try:
+            from onnxsim import simplify
+        except ImportError:
+            print("⚠️ onnxsim not installed, skip simplify (pip install onnxsim)")
+        else:
+            simplified, ok = simplify(model)
+            if ok:
+                model = simplified
+            else:
+                print("⚠️ onnxsim check failed, keep unsimplified model")
 
     onnx.checker.check_model(model)
     onnx.save(model, args.out)
     print("✅ patched model saved:", args.out)
 
+    if args.check and args.nms != "trt":  # EfficientNMS_TRT 只能在 TensorRT 中运行
+        smoke_test(args.out)
+
 if __name__ == "__main__":
     main()
 
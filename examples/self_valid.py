@@ -1,78 +1,223 @@
+import os
 import onnxruntime as ort
 import numpy as np
 import cv2
 
+try:
+    import torch
+    import torchvision.ops as tvops
+except ImportError:  # 没有 torchvision 时退回纯 NumPy NMS
+    tvops = None
+
 model = "../models/droplet.onnx"
-img_path = "../captures/edge-video-analyzer/liquid_leak_detection/frame_000000.jpg"
+img_paths = [
+    "../captures/edge-video-analyzer/liquid_leak_detection/frame_000000.jpg",
+]  # 多帧时按 batch 一次推理
 imgsz = 1280  # 你的导出尺寸
-
-# 读取图像 + letterbox到(imgsz,imgsz)
-im = cv2.imread(img_path)
-h0, w0 = im.shape[:2]
-r = min(imgsz / w0, imgsz / h0)
-nw, nh = int(round(w0 * r)), int(round(h0 * r))
-padx, pady = (imgsz - nw) // 2, (imgsz - nh) // 2
-im_resz = cv2.resize(im, (nw, nh), interpolation=cv2.INTER_LINEAR)
-canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
-canvas[pady:pady+nh, padx:padx+nw] = im_resz
-inp = canvas[:, :, ::-1].astype(np.float32) / 255.0  # BGR->RGB, 0-1
-inp = np.transpose(inp, (2,0,1))[None, ...]  # NCHW
-
-sess = ort.InferenceSession(model, providers=["CPUExecutionProvider"])
-inp_name = sess.get_inputs()[0].name
-out_name = sess.get_outputs()[0].name
-y = sess.run([out_name], {inp_name: inp})[0]  # [1,7,N] or [1,N,7]
-
-# 统一为 [N,7]
-if y.shape[1] == 7:
-    y = np.transpose(y, (0,2,1))
-y = y[0]  # [N,7]
-
-# 拆列
-x1, y1, x2, y2, f4, f5, f6 = [y[:,i] for i in range(7)]
-cls_id = np.rint(f5).astype(np.int32)
-
-# 兼容两种导出：conf=max(f4, f4*f6)
-conf_a = f4 * f6
-conf_b = f4
-conf = np.maximum(conf_a, conf_b)
-
-# 先取 top-K，避免全量NMS过慢
-K = 200
-idx_top = np.argpartition(-conf, K-1)[:K]
-idx_top = idx_top[np.argsort(-conf[idx_top])]
-
-boxes = np.stack([x1, y1, x2, y2], axis=1)[idx_top].astype(np.float32)
-scores = conf[idx_top].astype(np.float32)
-cids   = cls_id[idx_top]
-
-# 去letterbox映射回原图
-boxes[:, [0,2]] = (boxes[:, [0,2]] - padx) / r
-boxes[:, [1,3]] = (boxes[:, [1,3]] - pady) / r
-boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, w0-1)
-boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, h0-1)
-
-# 过滤 + NMS（OpenCV）
+# 默认使用与 main_yolo.cpp 一致的 OpenCV 预处理；SELF_VALID_NUMBA=1 时改用 numba 单遍内核
+# （首次调用有 JIT 编译开销，结果与 OpenCV 仅近似一致）
+use_numba = os.environ.get("SELF_VALID_NUMBA") == "1"
+# SELF_VALID_CACHE_OPT=1 时把 ORT 优化后的图缓存到模型旁（与本机 CPU 相关），默认不写文件
+cache_opt = os.environ.get("SELF_VALID_CACHE_OPT") == "1"
 conf_thres = 0.25  # 若还看不到框，可先降到0.10试试
 iou_thres  = 0.45
-keep_mask = scores >= conf_thres
-boxes = boxes[keep_mask]; scores = scores[keep_mask]; cids = cids[keep_mask]
-
-if len(boxes):
-    rects = [tuple(map(int, [b[0], b[1], b[2]-b[0], b[3]-b[1]])) for b in boxes]
-    idxs = cv2.dnn.NMSBoxes(rects, scores.tolist(), conf_thres, iou_thres)
-    vis = im.copy()
-    if len(idxs) > 0:
-        for j in idxs.flatten():
-            x,y,w,h = rects[j]
-            cv2.rectangle(vis, (x,y), (x+w, y+h), (0,255,0), 2)
-            cv2.putText(vis, f"id{int(cids[j])} {scores[j]:.2f}", (x, max(0,y-5)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 2, cv2.LINE_AA)
-        print("Kept:", len(idxs))
+
+def letterbox_params(im):
+    """letterbox到(imgsz,imgsz)的缩放比例、缩放后尺寸与左上填充"""
+    h0, w0 = im.shape[:2]
+    r = min(imgsz / w0, imgsz / h0)
+    nw, nh = int(round(w0 * r)), int(round(h0 * r))
+    padx, pady = (imgsz - nw) // 2, (imgsz - nh) // 2
+    return r, nw, nh, padx, pady
+
+def letterbox(im):
+    """letterbox到(imgsz,imgsz)，返回画布与映射参数 (r, padx, pady)"""
+    r, nw, nh, padx, pady = letterbox_params(im)
+    im_resz = cv2.resize(im, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    canvas = cv2.copyMakeBorder(im_resz, pady, imgsz-nh-pady, padx, imgsz-nw-padx,
+                                cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return canvas, (r, padx, pady)
+
+if use_numba:
+    from numba import njit, prange
+
+    @njit(parallel=True, cache=True)
+    def letterbox_to_blob(im, out, nw, nh, padx, pady):
+        """双线性缩放 + letterbox 填充 + BGR->RGB + /255 + HWC->CHW 一次写入 out[3,H,W]，按行并行"""
+        h0, w0 = im.shape[0], im.shape[1]
+        H, W = out.shape[1], out.shape[2]
+        fx, fy = w0 / nw, h0 / nh
+        pad = 114.0 / 255.0
+        for y in prange(H):
+            yy = y - pady
+            inside_y = yy >= 0 and yy < nh
+            # 与 cv2.INTER_LINEAR 相同的像素中心对齐
+            sy = min(max((yy + 0.5) * fy - 0.5, 0.0), h0 - 1.0)
+            y0 = int(sy)
+            y1 = min(y0 + 1, h0 - 1)
+            wy = sy - y0
+            for x in range(W):
+                xx = x - padx
+                if not inside_y or xx < 0 or xx >= nw:
+                    for c in range(3):
+                        out[c, y, x] = pad
+                else:
+                    sx = min(max((xx + 0.5) * fx - 0.5, 0.0), w0 - 1.0)
+                    x0 = int(sx)
+                    x1 = min(x0 + 1, w0 - 1)
+                    wx = sx - x0
+                    for c in range(3):
+                        ch = 2 - c  # BGR->RGB
+                        top = im[y0, x0, ch] * (1.0 - wx) + im[y0, x1, ch] * wx
+                        bot = im[y1, x0, ch] * (1.0 - wx) + im[y1, x1, ch] * wx
+                        # 与 cv2.resize 一样先取整到 uint8 再归一化
+                        out[c, y, x] = np.floor(top * (1.0 - wy) + bot * wy + 0.5) / 255.0
+
+def postprocess(y, im, meta):
+    """y 为单帧 [N,7]，返回映射回原图的 top-K boxes(xyxy)/scores/cids"""
+    h0, w0 = im.shape[:2]
+    r, padx, pady = meta
+
+    # 兼容两种导出：conf=max(f4, f4*f6) = f4*max(f6, 1)（f4>=0），只产生一个 N 长度临时数组
+    f4, f5, f6 = y[:, 4], y[:, 5], y[:, 6]
+    conf = np.maximum(f6, 1.0)
+    np.multiply(conf, f4, out=conf)
+
+    # 先取 top-K，避免全量NMS过慢；只对 K 个候选排序
+    N = conf.shape[0]
+    K = min(200, N)
+    idx_top = np.argpartition(conf, N-K)[-K:]
+    idx_top = idx_top[np.argsort(conf[idx_top])[::-1]]
+
+    boxes = y[idx_top, :4].astype(np.float32)
+    scores = conf[idx_top].astype(np.float32)
+    cids   = np.rint(f5[idx_top]).astype(np.int32)
+
+    # 去letterbox映射回原图：全部在 x/y 列的步长视图上原地计算，不产生 fancy-index 临时数组
+    xs, ys = boxes[:, 0::2], boxes[:, 1::2]
+    xs -= padx; ys -= pady
+    xs /= r; ys /= r
+    np.clip(xs, 0, w0-1, out=xs)
+    np.clip(ys, 0, h0-1, out=ys)
+    return boxes, scores, cids
+
+def nms_numpy(boxes, scores, cids, iou_thres):
+    """贪心 NMS：每轮用一次向量化 IoU 计算当前最高分框与剩余框"""
+    # 按类别平移坐标，不同类别的框互不相交，一次完成按类别 NMS
+    boxes = boxes + (cids.astype(np.float32) * (boxes.max() + 1))[:, None]
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    area = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        w = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / (area[i] + area[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+def nms(boxes, scores, cids, iou_thres):
+    """boxes 为 xyxy，按类别 NMS，返回保留下标（按分数降序）"""
+    if tvops is not None:
+        return tvops.batched_nms(torch.from_numpy(boxes), torch.from_numpy(scores),
+                                 torch.from_numpy(cids.astype(np.int64)), iou_thres).numpy()
+    return nms_numpy(boxes, scores, cids, iou_thres)
+
+def visualize(im, boxes, scores, cids, out_path):
+    # 过滤 + NMS（torchvision C++ 实现，缺失时用 NumPy 向量化实现，按类别分别抑制）
+    keep_mask = scores >= conf_thres
+    boxes = boxes[keep_mask]; scores = scores[keep_mask]; cids = cids[keep_mask]
+
+    if len(boxes):
+        keep = nms(boxes, scores, cids, iou_thres)
+        vis = im.copy()
+        if len(keep) > 0:
+            for j in keep:
+                x1, y1, x2, y2 = boxes[j].astype(np.int32)
+                cv2.rectangle(vis, (x1, y1), (x2, y2), (0,255,0), 2)
+                cv2.putText(vis, f"id{int(cids[j])} {scores[j]:.2f}", (x1, max(0,y1-5)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 2, cv2.LINE_AA)
+            print("Kept:", len(keep))
+        else:
+            print("After NMS kept: 0")
+        cv2.imwrite(out_path, vis)
+        print("Saved:", out_path)
     else:
-        print("After NMS kept: 0")
-    cv2.imwrite("result_verify.jpg", vis)
-    print("Saved: result_verify.jpg")
+        print("No boxes over conf_thres before NMS. Try lowering conf_thres to 0.10 and re-run.")
+
+# 会话参数：线程数按物理核心数设置，关闭自旋等待，开启全部图优化
+# OpenMP 构建的 onnxruntime 建议另外设置环境变量 OMP_WAIT_POLICY=PASSIVE
+opts = ort.SessionOptions()
+opts.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+opts.inter_op_num_threads = 1
+opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+
+# cache_opt：首次运行把 ORT 优化后的图写到 xxx.ort-<onnxruntime 版本>.onnx，之后直接加载并跳过图优化
+# 优化结果与 ORT 版本及本机 CPU 相关：版本写入文件名，换机器时删除该缓存文件
+if cache_opt:
+    opt_model = f"{os.path.splitext(model)[0]}.ort-{ort.__version__}.onnx"
+    if os.path.exists(opt_model) and os.path.getmtime(opt_model) >= os.path.getmtime(model):
+        model = opt_model
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    else:
+        opts.optimized_model_filepath = opt_model
+
+sess = ort.InferenceSession(model, sess_options=opts, providers=["CPUExecutionProvider"])
+inp_name = sess.get_inputs()[0].name
+out_name = sess.get_outputs()[0].name
+
+# batch 大小：静态导出用模型自带的 batch；动态 batch 按核数取，避免单次 Run 过大导致线程争用
+batch_dim = sess.get_inputs()[0].shape[0]
+if isinstance(batch_dim, int) and batch_dim > 0:
+    B = batch_dim
 else:
-    print("No boxes over conf_thres before NMS. Try lowering conf_thres to 0.10 and re-run.")
+    B = max(1, min(len(img_paths), (os.cpu_count() or 2) // 2))
+
+# IOBinding：输入 OrtValue 按 batch 预分配一次，逐批只覆盖其内容，避免每次 run 拷贝/重建张量
+# CPU 上 OrtValue 与 inp_buf 共享内存，numba 内核可直接写入
+io = sess.io_binding()
+inp_buf = np.empty((B, 3, imgsz, imgsz), dtype=np.float32)
+inp_ortvalue = ort.OrtValue.ortvalue_from_numpy(inp_buf, "cpu")
+io.bind_ortvalue_input(inp_name, inp_ortvalue)
+io.bind_output(out_name, "cpu")
+
+for start in range(0, len(img_paths), B):
+    paths = img_paths[start:start+B]
+    ims = [cv2.imread(p) for p in paths]
+    if use_numba:
+        # 预处理整体在一个 JIT 内核中完成，无中间图像
+        metas = []
+        for b, im in enumerate(ims):
+            r, nw, nh, padx, pady = letterbox_params(im)
+            letterbox_to_blob(im, inp_buf[b], nw, nh, padx, pady)
+            metas.append((r, padx, pady))
+        # 不足一个 batch 时用最后一帧补齐，保持绑定的输入形状不变
+        inp_buf[len(ims):] = inp_buf[len(ims)-1]
+    else:
+        canvases, metas = zip(*[letterbox(im) for im in ims])
+        # 不足一个 batch 时用最后一帧补齐，保持绑定的输入形状不变
+        canvases = list(canvases) + [canvases[-1]] * (B - len(canvases))
+        # BGR->RGB、0-1 归一化、HWC->NCHW 一次完成，输出连续 float32
+        inp = cv2.dnn.blobFromImages(canvases, scalefactor=1/255.0, size=(imgsz, imgsz),
+                                     swapRB=True, crop=False)  # [B,3,imgsz,imgsz]
+        inp_ortvalue.update_inplace(inp)
+
+    sess.run_with_iobinding(io)
+    y = io.get_outputs()[0].numpy()  # [B,7,N] or [B,N,7]
+
+    # 统一为 [B,N,7]
+    if y.shape[1] == 7:
+        y = np.transpose(y, (0,2,1))
 
+    for b, (path, im, meta) in enumerate(zip(paths, ims, metas)):
+        boxes, scores, cids = postprocess(y[b], im, meta)
+        if len(img_paths) == 1:
+            out_path = "result_verify.jpg"
+        else:
+            out_path = f"result_verify_{os.path.splitext(os.path.basename(path))[0]}.jpg"
+        visualize(im, boxes, scores, cids, out_path)
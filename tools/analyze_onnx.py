@@ -2,7 +2,8 @@ import onnx
 
 def analyze_onnx_model(model_path):
     print(f"=== Analyzing ONNX model: {model_path} ===")
-    model = onnx.load(model_path)
+    # 只分析图结构/算子类型，不需要权重数据：外部数据文件不读入内存
+    model = onnx.load(model_path, load_external_data=False)
     graph = model.graph
 
     # 1. 输出节点形状
@@ -17,7 +18,7 @@ def analyze_onnx_model(model_path):
         print(f" - {output.name}: shape={shape}")
 
     # 2. NMS 检测
-    nms_ops = [n for n in graph.node if n.op_type in ("NonMaxSuppression", "BatchedNMS", "NMS", "NonMaxSuppressionV4")]
+    nms_ops = [n for n in graph.node if n.op_type in ("NonMaxSuppression", "BatchedNMS", "NMS", "NonMaxSuppressionV4", "EfficientNMS_TRT")]
     print("\n[2] NMS inside model?:", "YES ✅" if len(nms_ops) else "NO ❌")
 
     # 3. 检查激活函数 (Sigmoid, Softmax)
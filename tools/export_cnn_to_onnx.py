@@ -31,6 +31,16 @@ def parse_shape(shape: str) -> Tuple[int, ...]:
     return tuple(parsed)
 
 
+def parse_floats(values: str) -> Tuple[float, ...]:
+    try:
+        parsed = tuple(float(v) for v in values.replace(",", " ").split())
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"Invalid float list: {values}") from exc
+    if not parsed:
+        raise argparse.ArgumentTypeError("At least one value must be provided")
+    return parsed
+
+
 def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Export a PyTorch CNN to ONNX")
     parser.add_argument("input", type=pathlib.Path, help="Path to the PyTorch model (.pt/.pth)")
@@ -56,6 +66,46 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=3,
         help="Number of image channels when instantiating the fallback stub network",
     )
+    parser.add_argument(
+        "--export-logits",
+        dest="export_logits",
+        action="store_true",
+        help="Drop the final Softmax of the fallback network and export raw logits",
+    )
+    parser.add_argument(
+        "--mean",
+        dest="mean",
+        type=parse_floats,
+        default=None,
+        help="Per-channel mean (e.g. 0.5,0.5,0.5) to bake into the graph as a Sub before the model",
+    )
+    parser.add_argument(
+        "--std",
+        dest="std",
+        type=parse_floats,
+        default=None,
+        help="Per-channel std (e.g. 0.5,0.5,0.5) to bake into the graph as a Div before the model",
+    )
+    parser.add_argument(
+        "--quantize",
+        dest="quantize",
+        choices=("dynamic", "static"),
+        default=None,
+        help="Additionally write an INT8 model (<output>.int8.onnx) using ONNX Runtime quantization",
+    )
+    parser.add_argument(
+        "--calibration-dir",
+        dest="calibration_dir",
+        type=pathlib.Path,
+        default=None,
+        help="Directory of sample images used to calibrate activations for --quantize static",
+    )
+    parser.add_argument(
+        "--fp16",
+        dest="fp16",
+        action="store_true",
+        help="Convert the exported model to float16 (inputs/outputs stay float32)",
+    )
     return parser
 
 
@@ -70,7 +120,7 @@ def load_torch():  # pragma: no cover - thin wrapper around dynamic import
     return torch, nn
 
 
-def build_fallback_network(nn_module, channels: int):
+def build_fallback_network(nn_module, channels: int, export_logits: bool = False):
     class TinyCnn(nn_module.Module):
         def __init__(self, in_channels: int):
             super().__init__()
@@ -81,11 +131,11 @@ def build_fallback_network(nn_module, channels: int):
                 nn_module.ReLU(inplace=True),
                 nn_module.AdaptiveAvgPool2d((1, 1)),
             )
-            self.classifier = nn_module.Sequential(
-                nn_module.Flatten(),
-                nn_module.Linear(32, 2),
-                nn_module.Softmax(dim=1),
-            )
+            # Softmax is monotonic, argmax-only callers can skip it entirely
+            head = [nn_module.Flatten(), nn_module.Linear(32, 2)]
+            if not export_logits:
+                head.append(nn_module.Softmax(dim=1))
+            self.classifier = nn_module.Sequential(*head)
 
         def forward(self, x):  # type: ignore[override]
             return self.classifier(self.features(x))
@@ -93,14 +143,131 @@ def build_fallback_network(nn_module, channels: int):
     return TinyCnn(channels)
 
 
-def load_model(torch_module, input_path: pathlib.Path, channels: int):
+def build_normalized_network(torch_module, model, mean: Tuple[float, ...], std: Tuple[float, ...]):
+    """Prepend ``(x - mean) / std`` so callers feed raw [0, 1] images.
+
+    Normalization runs in-graph as a Sub/Div ahead of the model instead of
+    being reimplemented by every caller.
+    """
+
+    class Normalized(torch_module.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+            self.register_buffer("mean", torch_module.tensor(mean, dtype=torch_module.float32).view(1, -1, 1, 1))
+            self.register_buffer("std", torch_module.tensor(std, dtype=torch_module.float32).view(1, -1, 1, 1))
+
+        def forward(self, x):  # type: ignore[override]
+            return self.model((x - self.mean) / self.std)
+
+    return Normalized().eval()
+
+
+def load_quantization():  # pragma: no cover - thin wrapper around dynamic import
+    try:
+        import onnxruntime  # type: ignore
+        from onnxruntime import quantization  # type: ignore
+    except ModuleNotFoundError as exc:  # pragma: no cover - environment guard
+        raise SystemExit(
+            "onnxruntime is required to quantize models. Install onnxruntime first."
+        ) from exc
+    return onnxruntime, quantization
+
+
+def iter_calibration_inputs(calibration_dir: pathlib.Path, input_shape: Tuple[int, ...]):
+    """Yield NCHW float32 tensors (RGB, scaled to [0, 1]) for every image in ``calibration_dir``."""
+    try:
+        import numpy as np  # type: ignore
+        from PIL import Image  # type: ignore
+    except ModuleNotFoundError as exc:  # pragma: no cover - environment guard
+        raise SystemExit("Static quantization requires numpy and Pillow for calibration data.") from exc
+
+    _, channels, height, width = input_shape
+    mode = "L" if channels == 1 else "RGB"
+    paths = sorted(
+        p for p in calibration_dir.iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".bmp"}
+    )
+    if not paths:
+        raise SystemExit(f"No calibration images found in {calibration_dir}")
+    for path in paths:
+        with Image.open(path) as image:
+            array = np.asarray(image.convert(mode).resize((width, height)), dtype=np.float32) / 255.0
+        array = array.reshape(height, width, channels).transpose(2, 0, 1)
+        yield np.ascontiguousarray(array[None, ...])
+
+
+def quantize_model(args) -> pathlib.Path:
+    """Write an INT8 copy of ``args.output`` and check that ONNX Runtime can load it.
+
+    Dynamic mode turns Conv into ``ConvInteger`` and MatMul into
+    ``DynamicQuantizeMatMul``; the CPU ``ConvInteger`` kernel only accepts
+    uint8 weights, so weights are quantized as QUInt8. Static mode writes a
+    QDQ graph (int8 activations and weights), which ONNX Runtime fuses into
+    ``QLinearConv`` / ``QLinearMatMul`` at load time; this is the better
+    choice for conv-heavy models.
+    """
+    onnxruntime, quantization = load_quantization()
+    target = args.output.with_suffix(".int8.onnx")
+
+    if args.quantize == "dynamic":
+        quantization.quantize_dynamic(
+            str(args.output), str(target), weight_type=quantization.QuantType.QUInt8
+        )
+    else:
+        quantize_static_model(quantization, args, target)
+
+    try:
+        onnxruntime.InferenceSession(str(target), providers=["CPUExecutionProvider"])
+    except Exception as exc:
+        raise SystemExit(f"Quantized model {target} cannot be loaded by ONNX Runtime: {exc}") from exc
+    return target
+
+
+def quantize_static_model(quantization, args, target: pathlib.Path) -> None:
+    """Calibrate activations on ``args.calibration_dir`` and write a QDQ INT8 model."""
+
+    class ImageCalibrationReader(quantization.CalibrationDataReader):
+        def __init__(self):
+            self._inputs = iter_calibration_inputs(args.calibration_dir, args.input_shape)
+
+        def get_next(self):
+            tensor = next(self._inputs, None)
+            return None if tensor is None else {"input": tensor}
+
+    quantization.quantize_static(
+        str(args.output),
+        str(target),
+        ImageCalibrationReader(),
+        quant_format=quantization.QuantFormat.QDQ,
+        activation_type=quantization.QuantType.QInt8,
+        weight_type=quantization.QuantType.QInt8,
+    )
+
+
+def convert_to_fp16(model_path: pathlib.Path) -> None:  # pragma: no cover - optional dependency
+    """Cast weights/activations of ``model_path`` to float16 in place, keeping FP32 graph I/O."""
+    try:
+        import onnx  # type: ignore
+        from onnxconverter_common import float16  # type: ignore
+    except ModuleNotFoundError as exc:  # pragma: no cover - environment guard
+        raise SystemExit(
+            "onnx and onnxconverter-common are required for --fp16. Install them first."
+        ) from exc
+    model = onnx.load(str(model_path))
+    model = float16.convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model, str(model_path))
+
+
+def load_model(torch_module, input_path: pathlib.Path, channels: int, export_logits: bool = False):
     input_str = str(input_path)
     try:
         model = torch_module.jit.load(input_str, map_location="cpu")
         model.eval()
+        if export_logits:
+            print("--export-logits only applies to the fallback network; keeping the scripted model as-is")
         return model
     except Exception:
-        model = build_fallback_network(torch_module.nn, channels)
+        model = build_fallback_network(torch_module.nn, channels, export_logits)
         try:
             checkpoint = torch_module.load(input_str, map_location="cpu")
             if isinstance(checkpoint, dict) and "state_dict" in checkpoint:
@@ -115,8 +282,18 @@ def load_model(torch_module, input_path: pathlib.Path, channels: int):
 
 
 def export_to_onnx(args):
+    if args.quantize == "static" and args.calibration_dir is None:
+        raise SystemExit("--quantize static requires --calibration-dir")
+
     torch, _ = load_torch()
-    model = load_model(torch, args.input, args.channels)
+    model = load_model(torch, args.input, args.channels, args.export_logits)
+    if args.mean is not None or args.std is not None:
+        channels = args.input_shape[1]
+        mean = args.mean or (0.0,) * channels
+        std = args.std or (1.0,) * channels
+        if len(mean) != channels or len(std) != channels:
+            raise SystemExit(f"--mean/--std must provide {channels} values")
+        model = build_normalized_network(torch, model, mean, std)
 
     dummy_input = torch.randn(*args.input_shape)
     args.output.parent.mkdir(parents=True, exist_ok=True)
@@ -132,6 +309,14 @@ def export_to_onnx(args):
     )
     print(f"Exported ONNX model to {args.output}")
 
+    if args.quantize:
+        target = quantize_model(args)
+        print(f"Exported {args.quantize} INT8 ONNX model to {target}")
+
+    if args.fp16:
+        convert_to_fp16(args.output)
+        print(f"Converted {args.output} to FP16")
+
 
 def main(argv=None):
     parser = build_arg_parser()
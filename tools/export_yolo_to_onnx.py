@@ -13,6 +13,9 @@ import argparse
 import pathlib
 from typing import Iterable, Tuple
 
+# Anything smaller cannot hold a serialized checkpoint worth unpickling.
+MIN_CHECKPOINT_BYTES = 1024
+
 
 def parse_shape(shape: str) -> Tuple[int, ...]:
     dims: Iterable[str] = shape.lower().replace("x", " ").replace(",", " ").split()
@@ -65,6 +68,22 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=13,
         help="ONNX opset version to use during export (default: 13)",
     )
+    parser.add_argument(
+        "--static-shape",
+        dest="static_shape",
+        action="store_true",
+        help=(
+            "Export without dynamic axes so every tensor shape is fixed to --input-shape, "
+            "letting ONNX Runtime/TensorRT pick shape-specialised kernels "
+            "(export once per supported resolution and batch size)"
+        ),
+    )
+    parser.add_argument(
+        "--fp16",
+        dest="fp16",
+        action="store_true",
+        help="Convert the exported model to float16 (inputs/outputs stay float32)",
+    )
     return parser
 
 
@@ -78,7 +97,7 @@ def load_torch():  # pragma: no cover - thin wrapper around dynamic import
     return torch, nn, F
 
 
-def build_fallback_network(nn_module, functional, in_channels: int, num_classes: int, anchors: int):
+def build_fallback_network(torch_module, nn_module, functional, in_channels: int, num_classes: int, anchors: int):
     class TinyYolo(nn_module.Module):
         def __init__(self, channels: int, classes: int, anchors_per_cell: int):
             super().__init__()
@@ -106,30 +125,54 @@ def build_fallback_network(nn_module, functional, in_channels: int, num_classes:
             x = x.view(bs, -1, self.num_classes + 5)
             objectness = functional.sigmoid(x[..., 4:5])
             class_scores = functional.softmax(x[..., 5:], dim=-1)
-            x = x.clone()
-            x[..., 4:5] = objectness
-            x[..., 5:] = class_scores
-            return x
+            # Concat instead of in-place slice assignment, which ONNX lowers to ScatterND
+            return torch_module.cat([x[..., :4], objectness, class_scores], dim=-1)
 
     return TinyYolo(in_channels, num_classes, anchors)
 
 
+def convert_to_fp16(model_path: pathlib.Path) -> None:  # pragma: no cover - optional dependency
+    """Cast weights/activations of ``model_path`` to float16 in place, keeping FP32 graph I/O."""
+    try:
+        import onnx  # type: ignore
+        from onnxconverter_common import float16  # type: ignore
+    except ModuleNotFoundError as exc:  # pragma: no cover - environment guard
+        raise SystemExit(
+            "onnx and onnxconverter-common are required for --fp16. Install them first."
+        ) from exc
+    model = onnx.load(str(model_path))
+    model = float16.convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model, str(model_path))
+
+
 def load_model(torch_module, nn_module, functional, input_path: pathlib.Path, num_classes: int, anchors: int):
     input_str = str(input_path)
+    if not input_path.is_file() or input_path.stat().st_size < MIN_CHECKPOINT_BYTES:
+        # nothing loadable: export the placeholder network without touching the loaders
+        print(
+            f"Warning: {input_path} is missing or smaller than {MIN_CHECKPOINT_BYTES} bytes; "
+            "exporting the randomly initialised placeholder network"
+        )
+        return build_fallback_network(torch_module, nn_module, functional, 3, num_classes, anchors).eval()
     try:
         model = torch_module.jit.load(input_str, map_location="cpu")
         model.eval()
         return model
     except Exception:
-        model = build_fallback_network(nn_module, functional, 3, num_classes, anchors)
+        model = build_fallback_network(torch_module, nn_module, functional, 3, num_classes, anchors)
         try:
-            checkpoint = torch_module.load(input_str, map_location="cpu")
+            # weights_only skips arbitrary pickle execution (PyTorch >= 2.0)
+            checkpoint = torch_module.load(input_str, map_location="cpu", weights_only=True)
             if isinstance(checkpoint, dict) and "state_dict" in checkpoint:
                 model.load_state_dict(checkpoint["state_dict"], strict=False)
             elif isinstance(checkpoint, dict):
                 model.load_state_dict(checkpoint, strict=False)
-        except Exception:
-            pass
+        except Exception as exc:
+            # weights_only rejects non-tensor metadata (and is unknown before PyTorch 1.13)
+            print(
+                f"Warning: could not load weights from {input_path} ({type(exc).__name__}: {exc}); "
+                "exporting the randomly initialised placeholder network"
+            )
         model.eval()
         return model
 
@@ -148,10 +191,14 @@ def export_to_onnx(args):
         opset_version=args.opset,
         input_names=["images"],
         output_names=["detections"],
-        dynamic_axes={"images": {0: "batch"}, "detections": {0: "batch"}},
+        dynamic_axes=None if args.static_shape else {"images": {0: "batch"}, "detections": {0: "batch"}},
     )
     print(f"Exported YOLO ONNX model to {args.output}")
 
+    if args.fp16:
+        convert_to_fp16(args.output)
+        print(f"Converted {args.output} to FP16")
+
 
 def main(argv=None):
     parser = build_arg_parser()
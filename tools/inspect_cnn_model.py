@@ -1,9 +1,61 @@
+import os
+import argparse
+from functools import lru_cache
 import onnx
 import numpy as np
 import onnxruntime as ort
 
-def inspect_model(path: str):
-    model = onnx.load(path)
+def make_session_options(
+    graph_optimization_level: ort.GraphOptimizationLevel = ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+) -> ort.SessionOptions:
+    """线程数按物理核心数设置，关闭自旋等待，默认开启全部图优化。
+
+    OpenMP 构建的 onnxruntime 建议另外设置环境变量 OMP_WAIT_POLICY=PASSIVE。
+    """
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+    opts.inter_op_num_threads = 1
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = graph_optimization_level
+    opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    return opts
+
+@lru_cache(maxsize=None)
+def load_model(path: str) -> onnx.ModelProto:
+    """同一路径只从磁盘解析一次"""
+    return onnx.load(path)
+
+def optimized_model_path(path: str) -> str:
+    """ORT 优化后模型的缓存路径：xxx.onnx -> xxx.ort-<onnxruntime 版本>.onnx
+
+    优化结果与 ORT 版本及本机 CPU 相关，版本写入文件名，升级 ORT 后自动重新生成。
+    """
+    return f"{os.path.splitext(path)[0]}.ort-{ort.__version__}.onnx"
+
+@lru_cache(maxsize=None)
+def load_session(path: str, cache_optimized: bool = False) -> ort.InferenceSession:
+    """复用已解析的 ModelProto 建会话。
+
+    cache_optimized=True 时优先加载已缓存的优化模型（跳过图优化），否则写出优化结果供下次使用；
+    默认不在模型目录写任何文件。
+    """
+    if not cache_optimized:
+        return ort.InferenceSession(load_model(path).SerializeToString(),
+                                    sess_options=make_session_options(),
+                                    providers=["CPUExecutionProvider"])
+    opt_path = optimized_model_path(path)
+    if os.path.exists(opt_path) and os.path.getmtime(opt_path) >= os.path.getmtime(path):
+        return ort.InferenceSession(opt_path,
+                                    sess_options=make_session_options(ort.GraphOptimizationLevel.ORT_DISABLE_ALL),
+                                    providers=["CPUExecutionProvider"])
+    opts = make_session_options()
+    opts.optimized_model_filepath = opt_path
+    return ort.InferenceSession(load_model(path).SerializeToString(),
+                                sess_options=opts,
+                                providers=["CPUExecutionProvider"])
+
+def inspect_model(path: str, cache_optimized: bool = False):
+    model = load_model(path)
     graph = model.graph
 
     print("\n=== 🔍 模型 I/O 信息 ===")
@@ -30,7 +82,7 @@ def inspect_model(path: str):
 
     # 用随机输入跑一遍推理尝试推测输出范围
     print("\n=== ▶️ 测试一次推理输出范围 ===")
-    sess = ort.InferenceSession(path)
+    sess = load_session(path, cache_optimized)
     input_node = sess.get_inputs()[0]
     shape = input_node.shape
 
@@ -42,5 +94,10 @@ def inspect_model(path: str):
     print("Output range:", float(np.min(out)), "to", float(np.max(out)))
 
 if __name__ == "__main__":
-    inspect_model("../models/cnn_haze.onnx")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("model", nargs="?", default="../models/cnn_haze.onnx")
+    ap.add_argument("--cache-optimized", dest="cache_optimized", action="store_true",
+                    help="write/reuse the ORT-optimized graph next to the model (hardware specific)")
+    args = ap.parse_args()
+    inspect_model(args.model, args.cache_optimized)
 